@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
+import concurrent.futures
 import datetime
+import hashlib
 import json
 import os
 import pathlib
+import pickle
+import sys
 import calendar
+from collections import defaultdict
 from dataclasses import dataclass
-from decimal import Decimal
+from operator import attrgetter
 
 import natsort
-import PyPDF2
+import pymupdf
 import typer
 import xlsxwriter
 
@@ -17,7 +22,8 @@ from rich import print as rprint
 from rich.progress import track
 from rich.table import Column, Table, Style, Text
 
-from parsers.expense import Expense
+from parsers.common import layout_text
+from parsers.expense import decimal_zero, Expense
 from parsers.my_main_money import MyMainMoney
 from parsers.nsf import NSF
 from parsers.visa_avion_unlimited import VISAAvionUnlimited
@@ -38,12 +44,22 @@ class AppOptions:
     output_path: str = './output'
     categories_path: str = './categories.json'
     ignored_path: str = './ignored.json'
+    cache_path: str = './cache'
     verbose: bool = False
     dry_run: bool = False
 
 
 app_options = AppOptions()
 
+# parsers keyed by the account name found in the statement file name
+statement_parsers = (
+    ('My Main Money Account', MyMainMoney),
+    ('VISA Avion Unlimited', VISAAvionUnlimited),
+)
+
+# Bump this whenever a parser change alters the parsed results so cached statements are invalidated
+parser_cache_version = 4
+
 # folder paths
 statement_path = pathlib.Path(app_options.statement_path)
 output_path = pathlib.Path(app_options.output_path)
@@ -52,6 +68,11 @@ categories = {}
 page_order = []
 ignored = []
 
+# report styles
+year_style = Style(bgcolor='blue')
+total_style = Style(color='grey53')
+total_label = Text('Total', justify='right', style=total_style)
+
 
 def debug(message):
     """
@@ -93,7 +114,9 @@ def load_categories(display: bool = False):
         last_category = None
         page_order = [''] * len(config)
         for page, page_categories in config.items():
+            page = sys.intern(page)
             for category, patterns in page_categories.items():
+                category = sys.intern(category)
                 # Record the display order for later, then ditch it
                 if category == 'display_order':
                     page_order[patterns - 1] = page
@@ -103,6 +126,11 @@ def load_categories(display: bool = False):
                     if friendly_name is None:
                         friendly_name = pattern
 
+                    # Every matching expense shares these strings, intern them so they hash and compare by identity,
+                    # see intern_statement_items for restoring that once results have been through pickle
+                    pattern = sys.intern(pattern)
+                    friendly_name = sys.intern(friendly_name)
+
                     add_page = False
                     add_category = False
 
@@ -125,6 +153,43 @@ def load_categories(display: bool = False):
         rprint(table)
 
 
+def statement_cache_key(statement: pathlib.Path) -> str:
+    """
+    Build the cache key for a parsed statement
+
+    Args:
+        statement: The statement to build the key for
+
+    """
+    stat = statement.stat()
+    # The file name picks the parser and the statement date, so renaming a statement must invalidate the cache
+    digest = hashlib.sha1(f'{parser_cache_version}:{statement.name}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    with open(statement, 'rb') as f:
+        digest.update(f.read(4096))
+
+    # Parsing depends on the categories so changing them must invalidate the cache
+    digest.update(repr(categories).encode())
+
+    return digest.hexdigest()
+
+
+def intern_statement_items(items):
+    """
+    Re-intern the strings shared by parsed items
+
+    Statements come back from the worker processes and the cache through pickle, which hands each
+    statement its own copies of the page, category and line strings.
+
+    Args:
+        items: The expenses or NSFs to update in place
+
+    """
+    for item in items:
+        item.page = sys.intern(item.page)
+        item.category = sys.intern(item.category)
+        item.line = sys.intern(item.line)
+
+
 def process_statement(statement: pathlib.Path):
     """
     Process a statement
@@ -143,40 +208,69 @@ def process_statement(statement: pathlib.Path):
         return pages_expenses, pages_nsfs
 
     debug(f'statement date: {statement_date}')
-    debug(f'processing statement: {statement}')
 
-    statement_parsers = {
-        'My Main Money Account': MyMainMoney,
-        'VISA Avion Unlimited': VISAAvionUnlimited,
-    }
+    cache_file = pathlib.Path(app_options.cache_path) / f'{statement_cache_key(statement)}.pkl'
+    if cache_file.is_file():
+        debug(f'loading cached statement: {cache_file}')
+        with open(cache_file, 'rb') as f:
+            pages_expenses, pages_nsfs = pickle.load(f)
+        intern_statement_items(pages_expenses)
+        intern_statement_items(pages_nsfs)
+        return pages_expenses, pages_nsfs
+
+    debug(f'processing statement: {statement}')
 
     parser = None
-    for statement_name, parser_klass in statement_parsers.items():
-        if statement.match(f'*{statement_name}*'):
+    for statement_name, parser_klass in statement_parsers:
+        if statement_name in statement.name:
             app_options.verbose and rprint(f'using parser "{parser_klass.__name__}"')
             parser = parser_klass(categories, options=app_options, start_date=statement_date)
+            break
 
     if parser is None:
         raise ValueError(f'could not find a parser for {statement}')
 
-    with open(statement, 'rb') as f:
-        pdf_reader = PyPDF2.PdfFileReader(f)
-        debug(f'Pages: {pdf_reader.numPages}')
+    with pymupdf.open(statement) as doc:
+        debug(f'Pages: {doc.page_count}')
 
         previous_page_last_line = ''
-        for page_number in range(0, pdf_reader.numPages):
-            page = pdf_reader.getPage(page_number)
+        for page_number, page in enumerate(doc):
             expenses, nsfs, previous_page_last_line = parser.process_page(
                 page_number,
-                page,
+                layout_text(page.get_text('words')),
                 previous_page_last_line
             )
             pages_expenses.extend(expenses)
             pages_nsfs.extend(nsfs)
 
+    if not parser.found_start_of_items:
+        rprint(f'[red]no transactions header found in {statement.name}, has the statement layout changed?[/red]')
+
+    if not app_options.dry_run:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        partial_cache_file = cache_file.with_suffix('.tmp')
+        with open(partial_cache_file, 'wb') as f:
+            pickle.dump((pages_expenses, pages_nsfs), f)
+        os.replace(partial_cache_file, cache_file)
+        debug(f'cached statement: {cache_file}')
+
     return pages_expenses, pages_nsfs
 
 
+def init_statement_worker(options: AppOptions):
+    """
+    Prepare a worker process to parse statements
+
+    Args:
+        options: The application options of the parent process
+
+    """
+    global app_options
+
+    app_options = options
+    load_categories()
+
+
 def process_statements():
     """
     Process the statements in the configured path
@@ -185,19 +279,29 @@ def process_statements():
     rprint(
         f'processing [yellow]{statement_path}[/yellow] and outputting to [yellow]{output_path}[/yellow] using [yellow]{app_options.categories_path}[/yellow]'
     )
-    statement_items = track(
-        natsort.natsorted(statement_path.iterdir()),
-        description='Processing Statements...',
-        auto_refresh=False,
-        transient=True
-    )
+    statement_files = [
+        path_item for path_item in natsort.natsorted(statement_path.iterdir()) if path_item.is_file()
+    ]
 
     all_expenses = []
     all_nsfs = []
 
-    for path_item in statement_items:
-        if path_item.is_file():
-            statement_expenses, statement_nsfs = process_statement(path_item)
+    # Statements are independent of each other, so parse them in parallel
+    with concurrent.futures.ProcessPoolExecutor(
+        initializer=init_statement_worker,
+        initargs=(app_options,)
+    ) as executor:
+        statement_results = track(
+            executor.map(process_statement, statement_files),
+            total=len(statement_files),
+            description='Processing Statements...',
+            auto_refresh=False,
+            transient=True
+        )
+
+        for statement_expenses, statement_nsfs in statement_results:
+            intern_statement_items(statement_expenses)
+            intern_statement_items(statement_nsfs)
             all_expenses.extend(statement_expenses)
             all_nsfs.extend(statement_nsfs)
 
@@ -253,12 +357,27 @@ def list_files():
     rprint(table)
 
 
+def nested_defaultdict(depth: int, factory):
+    """
+    Create a defaultdict nested depth levels deep
+
+    Args:
+        depth: The number of key levels
+        factory: The factory for the innermost values
+
+    """
+    if depth == 1:
+        return defaultdict(factory)
+
+    return defaultdict(lambda: nested_defaultdict(depth - 1, factory))
+
+
 def display_expenses(expenses: list[Expense]):
     """
     Display the list of expenses
 
     Args:
-        expenses:
+        expenses: The expenses to display, in date order
 
     """
     table = Table(
@@ -270,7 +389,7 @@ def display_expenses(expenses: list[Expense]):
         title='Statements'
     )
 
-    for expense in sorted(expenses, key=lambda e: e.date):
+    for expense in expenses:
         table.add_row(
             expense.date.isoformat(),
             expense.page,
@@ -286,22 +405,42 @@ def generate_report(expenses: list[Expense]):
     """
     Generate an Expense report grouped by Year, Page and Category
 
+    The expenses are sorted once here so every category list is already in date order for display and export.
+
     """
-    report = {}
+    report = nested_defaultdict(3, list)
 
-    for expense in expenses:
-        if expense.date.year not in report:
-            report[expense.date.year] = {}
+    for expense in sorted(expenses, key=attrgetter('date')):
+        report[expense.date.year][expense.page][expense.category].append(expense)
 
-        if expense.page not in report[expense.date.year]:
-            report[expense.date.year][expense.page] = {}
+    return report
 
-        if expense.category not in report[expense.date.year][expense.page]:
-            report[expense.date.year][expense.page][expense.category] = []
 
-        report[expense.date.year][expense.page][expense.category].append(expense)
+def collect_monthly_totals(pages, monthly_pages: list[str]):
+    """
+    Collect the amounts per month and the total for each vendor on the monthly pages of a year
 
-    return report
+    Args:
+        pages: The report pages for a single year
+        monthly_pages: The pages that are reported by month
+
+    """
+    monthly_totals = nested_defaultdict(3, lambda: {'total': decimal_zero})
+
+    for page, page_categories in pages.items():
+        if page not in monthly_pages:
+            debug(f'skipping page {page}')
+            continue
+        debug(f'processing page {page}')
+        for category, items in page_categories.items():
+            for item in items:
+                assert isinstance(item, Expense)
+                # Resolve the vendor once rather than walking the whole chain per access
+                vendor_totals = monthly_totals[page][category][item.line]
+                vendor_totals.setdefault(item.date.month, []).append(item.amount)
+                vendor_totals['total'] += item.amount
+
+    return monthly_totals
 
 
 def display_report(report_data):
@@ -313,7 +452,6 @@ def display_report(report_data):
         'Housing and Utilities',
     ]
 
-    totals = {}
     table = Table(
         'Year',
         'Page',
@@ -326,9 +464,7 @@ def display_report(report_data):
     for year, pages in report_data.items():
         table.add_row(
             str(year),
-            style=Style(
-                bgcolor='blue'
-            )
+            style=year_style
         )
 
         for page in page_order:
@@ -355,69 +491,33 @@ def display_report(report_data):
                         '',
                         category,
                     )
-                for item in sorted(items, key=lambda i: i.date):
+                category_total = decimal_zero
+                for item in items:
                     assert isinstance(item, Expense)
                     table.add_row('', '', '', item.line, item.date.isoformat(), item.amount.to_eng_string())
-                    if year not in totals:
-                        totals[year] = {}
-                    if page not in totals[year]:
-                        totals[year][page] = {}
-                    if category not in totals[year][page]:
-                        totals[year][page][category] = Decimal(0)
-                    totals[year][page][category] += item.amount
+                    category_total += item.amount
                 # Add the total for the category
                 table.add_row(
                     '',
                     '',
                     '',
                     '',
+                    total_label,
                     Text(
-                        'Total',
-                        justify='right',
-                        style=Style(
-                            color='grey53',
-                        )
-                    ),
-                    Text(
-                        totals[year][page][category].to_eng_string(),
-                        style=Style(
-                            color='grey53',
-                        )
+                        category_total.to_eng_string(),
+                        style=total_style
                     ),
                 )
 
     rprint(table)
 
     # Collect Monthly Expenses
-    monthly_expenses = {}
-
     totals = {}
 
     for year, pages in report_data.items():
-        for page, page_categories in pages.items():
-            if page not in monthly_pages:
-                continue
-            for category, items in page_categories.items():
-                for item in items:
-                    assert isinstance(item, Expense)
-                    if year not in totals:
-                        totals[year] = {}
-                    if page not in totals[year]:
-                        totals[year][page] = {}
-                    if category not in totals[year][page]:
-                        totals[year][page][category] = {}
-                    if item.line not in totals[year][page][category]:
-                        totals[year][page][category][item.line] = {}
-                    if item.date.month not in totals[year][page][category][item.line]:
-                        totals[year][page][category][item.line][item.date.month] = [
-                            item.amount.to_eng_string()
-                        ]
-                    else:
-                        totals[year][page][category][item.line][item.date.month].append(item.amount.to_eng_string())
-                    if 'total' not in totals[year][page][category][item.line]:
-                        totals[year][page][category][item.line]['total'] = Decimal(0)
-
-                    totals[year][page][category][item.line]['total'] += item.amount
+        year_totals = collect_monthly_totals(pages, monthly_pages)
+        if year_totals:
+            totals[year] = year_totals
 
     debug(totals)
 
@@ -437,9 +537,7 @@ def display_report(report_data):
         if year != last_year:
             table.add_row(
                 str(year),
-                style=Style(
-                    bgcolor='blue'
-                )
+                style=year_style
             )
             last_year = year
 
@@ -459,7 +557,7 @@ def display_report(report_data):
                     month_amounts = ['---', ] * 12
                     for m in range(1, 13):
                         if m in items:
-                            month_amounts[m - 1] = '\n'.join(items[m])
+                            month_amounts[m - 1] = '\n'.join(i.to_eng_string() for i in items[m])
 
                     table.add_row(
                         '', '', '', vendor,
@@ -483,9 +581,9 @@ def export_report(report_data):
 
     month_names = [calendar.month_abbr[m] for m in range(1, 13)]
 
-    totals = {}
     for year, pages in report_data.items():
-        workbook = xlsxwriter.Workbook(f'output/{year}-expenses.xlsx')
+        # Rows are always written in order, so let each row be flushed as soon as the next one starts
+        workbook = xlsxwriter.Workbook(f'output/{year}-expenses.xlsx', {'constant_memory': True})
 
         header_format = workbook.add_format(
             {
@@ -552,53 +650,24 @@ def export_report(report_data):
                     worksheet.write(current_row, 0, category)
                     current_row += 1
 
-                for item in sorted(items, key=lambda i: i.date):
+                category_total = decimal_zero
+                for item in items:
                     assert isinstance(item, Expense)
                     worksheet.write_row(current_row, 1, [item.line, item.date.isoformat(), item.amount])
                     current_row += 1
 
-                    if year not in totals:
-                        totals[year] = {}
-                    if page not in totals[year]:
-                        totals[year][page] = {}
-                    if category not in totals[year][page]:
-                        totals[year][page][category] = Decimal(0)
-                    totals[year][page][category] += item.amount
+                    category_total += item.amount
 
                 # Add the total for the category
                 worksheet.write_row(
-                    current_row, 2, ['Total', totals[year][page][category]], total_format
+                    current_row, 2, ['Total', category_total], total_format
                 )
                 current_row += 1
 
         report_pages = report_data[year]
-        report_totals = {}
 
         debug('processing monthly_pages')
-        for report_page, report_page_categories in report_pages.items():
-            if report_page not in monthly_pages:
-                debug(f'skipping page {report_page}')
-                continue
-            debug(f'processing page {report_page}')
-            for category, items in report_page_categories.items():
-                for item in items:
-                    assert isinstance(item, Expense)
-                    if report_page not in report_totals:
-                        report_totals[report_page] = {}
-                    if category not in report_totals[report_page]:
-                        report_totals[report_page][category] = {}
-                    if item.line not in report_totals[report_page][category]:
-                        report_totals[report_page][category][item.line] = {}
-                    if item.date.month not in report_totals[report_page][category][item.line]:
-                        report_totals[report_page][category][item.line][item.date.month] = [
-                            item.amount
-                        ]
-                    else:
-                        report_totals[report_page][category][item.line][item.date.month].append(item.amount)
-                    if 'total' not in report_totals[report_page][category][item.line]:
-                        report_totals[report_page][category][item.line]['total'] = Decimal(0)
-
-                    report_totals[report_page][category][item.line]['total'] += item.amount
+        report_totals = collect_monthly_totals(report_pages, monthly_pages)
 
         debug('generating monthly expenses')
         for monthly_page, monthly_categories in report_totals.items():
@@ -649,21 +718,20 @@ def filter_visa_debit_corrections(expenses: list[Expense]):
     """
     debug(f'filtering visa debit corrections from {len(expenses)} expenses')
 
-    virtual_debit_map = {}
+    seen: dict[str, int] = {}
+    drop: set[int] = set()
     for index, expense in enumerate(expenses):
         if expense.visa_debit_id is not None:
-            if expense.visa_debit_id in virtual_debit_map:
+            if expense.visa_debit_id in seen:
                 debug(f'removing corrected expense {expense} ')
-                # @ToDo: this can't be efficient ...
-                try:
-                    expenses.remove(virtual_debit_map[expense.visa_debit_id])
-                    expenses.remove(expense)
-                except ValueError as e:
-                    debug(f'[red]{e}[/red]')
+                drop.add(seen.pop(expense.visa_debit_id))
+                drop.add(index)
                 continue
 
             debug(f'adding {expense} to map')
-            virtual_debit_map[expense.visa_debit_id] = expense
+            seen[expense.visa_debit_id] = index
+
+    expenses = [e for i, e in enumerate(expenses) if i not in drop]
 
     debug(f'{len(expenses)} expenses remain after filtering')
     return expenses
@@ -739,8 +807,8 @@ def get_expenses(statement: str):
         statement_expenses, statement_nsfs = process_statement(path_item)
 
     # Force the sort here by date so that we can rely on it downstream
-    statement_expenses = sorted(statement_expenses, key=lambda se: se.date)
-    statement_nsfs = sorted(statement_nsfs, key=lambda sn: sn.date)
+    statement_expenses = sorted(statement_expenses, key=attrgetter('date'))
+    statement_nsfs = sorted(statement_nsfs, key=attrgetter('date'))
 
     filtered_expenses = filter_nsfs(
         filter_visa_debit_corrections(
@@ -1,6 +1,7 @@
 import datetime
-
-import PyPDF2
+import functools
+import re
+from decimal import Decimal
 
 from abc import ABC, abstractmethod
 from rich import print as rprint
@@ -8,6 +9,99 @@ from rich.text import Text, Style
 
 from parsers.nsf import NSF
 
+page_header_style = Style(bgcolor='blue_violet')
+
+month_abbreviations = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+month_numbers = {name: number for number, name in enumerate(month_abbreviations, start=1)}
+
+
+@functools.lru_cache(maxsize=8)
+def compile_categories(patterns: tuple[str, ...]) -> re.Pattern:
+    """
+    Compile the category patterns into a single matcher
+
+    The patterns are plain substrings, so they are escaped and joined into one
+    alternation that scans a line once instead of once per category. Longer
+    patterns are tried first so a more specific pattern wins over one it
+    contains. The result is cached so each statement parser reuses the same
+    compiled matcher.
+
+    Args:
+        patterns: The category patterns
+
+    """
+    if not patterns:
+        # Nothing to match, never match anything
+        return re.compile(r'(?!)')
+
+    return re.compile('|'.join(re.escape(pattern) for pattern in sorted(patterns, key=len, reverse=True)))
+
+
+@functools.lru_cache(maxsize=512)
+def parse_date(day: str, month: str, year: int) -> datetime.date:
+    """
+    Convert a statement day and abbreviated month such as "12", "Jan" into a date
+
+    The month is looked up directly rather than going through strptime, and
+    since a statement only has a few dozen distinct dates but repeats them on
+    many lines, the parsed dates are cached as well.
+
+    Args:
+        day: The day of the month
+        month: The abbreviated month name
+        year: The year of the date
+
+    """
+    return datetime.date(year, month_numbers[month], int(day))
+
+
+def layout_text(words) -> str:
+    """
+    Rebuild the visual lines of a page from its words
+
+    PyMuPDF returns each text run of a page on its own line, while the parsers expect every row of the statement on one
+    line with its columns separated by spaces. Words are grouped into rows by their vertical position and each row is
+    read from left to right.
+
+    Args:
+        words: The words of the page as returned by page.get_text('words')
+
+    """
+    lines = []
+    row = []
+    row_middle = None
+    for word in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        x0, y0, x1, y1, text = word[:5]
+        middle = (y0 + y1) / 2
+        # A word belongs to the current row while it overlaps the row's centre line
+        if row and middle - row_middle > (y1 - y0) / 2:
+            lines.append(' '.join(w[4] for w in sorted(row, key=lambda w: w[0])))
+            row = []
+
+        if not row:
+            row_middle = middle
+        row.append(word)
+
+    if row:
+        lines.append(' '.join(w[4] for w in sorted(row, key=lambda w: w[0])))
+
+    return '\n'.join(lines)
+
+
+def parse_amount(amount: str) -> Decimal:
+    """
+    Convert a matched statement amount such as "1,224.19" into a Decimal
+
+    Args:
+        amount: The amount as printed on the statement
+
+    """
+    # Most amounts are under a thousand, skip copying the string when there is no separator
+    if ',' in amount:
+        amount = amount.replace(',', '')
+
+    return Decimal(amount)
+
 
 class Parser(ABC):
     """
@@ -28,9 +122,13 @@ class Parser(ABC):
 
         """
         self.categories = categories
+        self.category_regex = compile_categories(tuple(categories))
         self.options = options
+        # Checked before building debug messages so the hot loops skip the formatting entirely
+        self.debug_enabled = options.verbose
         self.start_date = start_date
         self.current_year = start_date.year
+        self.found_start_of_items = False
 
     @property
     @abstractmethod
@@ -45,9 +143,65 @@ class Parser(ABC):
             message:
 
         """
-        if self.options.verbose:
+        if self.debug_enabled:
             rprint(message)
 
+    def find_start_of_items(self, line_items: list[str]):
+        """
+        Find the transaction header on a page
+
+        Depending on the layout the header can be split over several lines or have its columns run together, so the
+        lines are compared without whitespace and a header spread over several lines is joined back into one.
+
+        Args:
+            line_items: The lines of the page
+
+        Returns:
+            The lines with the header as a single start_of_items line, or None if the page has no header
+
+        """
+        header = ''.join(self.start_of_items.split())
+        for start in range(len(line_items)):
+            compact = ''
+            for end in range(start, min(start + 3, len(line_items))):
+                compact += ''.join(line_items[end].split())
+                if compact == header:
+                    return line_items[:start] + [self.start_of_items] + line_items[end + 1:]
+
+                if not header.startswith(compact):
+                    break
+
+        return None
+
+    def match_category(self, line: str):
+        """
+        Find the category a line belongs to
+
+        When several patterns occur in the line the longest one wins, ties go to
+        the one found first.
+
+        Args:
+            line: The line to categorize
+
+        Returns:
+            The matched pattern with its (page, category, friendly_name), or None if no category matches
+
+        """
+        # finditer skips matches that overlap an earlier one, so search again from just past each
+        # match start, the alternation is longest first so each hit is the longest at its position
+        category_match = None
+        match = self.category_regex.search(line)
+        while match is not None:
+            if category_match is None or len(match.group(0)) > len(category_match.group(0)):
+                category_match = match
+            match = self.category_regex.search(line, match.start() + 1)
+
+        if category_match is None:
+            return None
+
+        category_pattern = category_match.group(0)
+        return category_pattern, self.categories[category_pattern]
+
     def process_page_lines(self, line_items, previous_line_item=''):
         """
         Parse the extracted data
@@ -59,14 +213,16 @@ class Parser(ABC):
         processed_nsfs = []
         for line_number, line_item in enumerate(line_items, start=1):
             if line_item == self.start_of_items:
-                self.debug(f'[green]found header on line #{line_number}[/green]')
+                if self.debug_enabled:
+                    self.debug(f'[green]found header on line #{line_number}[/green]')
                 found_start = True
                 continue
 
             if not found_start:
                 continue
 
-            self.debug(f'[yellow4]{line_number:3d}[/yellow4]: [grey58]{line_item}[/grey58]')
+            if self.debug_enabled:
+                self.debug(f'[yellow4]{line_number:3d}[/yellow4]: [grey58]{line_item}[/grey58]')
 
             current_date = ''
             if found_start:
@@ -79,7 +235,6 @@ class Parser(ABC):
                 if processed_item.date:
                     current_date = processed_item.date
                 else:
-                    processed_item.year = self.current_year
                     processed_item.date = f'{current_date}'
 
                 if isinstance(processed_item, NSF):
@@ -89,13 +244,27 @@ class Parser(ABC):
 
         return processed_expenses, processed_nsfs, previous_line_item
 
-    def process_page(self, page_number, page: PyPDF2.PageObject, previous_page_last_line):
+    def process_page(self, page_number: int, text: str, previous_page_last_line):
         """
         Process a page from the statement
 
+        Args:
+            page_number: The zero based page number
+            text: The text extracted from the page
+            previous_page_last_line: The last line of the previous page
+
         """
-        self.debug(Text(f'Processing page {page_number + 1}{" " * 79}', style=Style(bgcolor='blue_violet')))
-        line_items = page.extract_text().splitlines()
+        if self.debug_enabled:
+            self.debug(Text(f'Processing page {page_number + 1}{" " * 79}', style=page_header_style))
+
+        # Cover, marketing and legal pages have no transaction header so nothing on them can be an item
+        line_items = self.find_start_of_items(text.splitlines())
+        if line_items is None:
+            if self.debug_enabled:
+                self.debug(f'[grey58]skipping page {page_number + 1}, no transactions found[/grey58]')
+            return [], [], previous_page_last_line
+
+        self.found_start_of_items = True
 
         return self.process_page_lines(line_items, previous_page_last_line)
 
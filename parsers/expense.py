@@ -1,20 +1,25 @@
 import datetime
 from decimal import Decimal
 
+# Decimals are immutable, so every zero amount can share one instance
+decimal_zero = Decimal(0)
+
 
 class Expense:
     """
     An Expense
 
     """
+    __slots__ = ('date', 'page', 'category', 'amount', 'line_number', 'line', 'visa_debit_id', 'reversal')
+
     date: datetime.date
-    page: str = ''
-    category: str = ''
-    amount: Decimal = Decimal(0)
-    line_number: int = 0
-    line: str = ''
-    visa_debit_id: str = None
-    reversal: bool = False
+    page: str
+    category: str
+    amount: Decimal
+    line_number: int
+    line: str
+    visa_debit_id: str
+    reversal: bool
 
     def __init__(self, date: datetime.date):
         """
@@ -25,6 +30,13 @@ class Expense:
 
         """
         self.date = date
+        self.page = ''
+        self.category = ''
+        self.amount = decimal_zero
+        self.line_number = 0
+        self.line = ''
+        self.visa_debit_id = None
+        self.reversal = False
 
     def __str__(self):
         """
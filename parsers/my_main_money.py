@@ -1,27 +1,27 @@
-from datetime import datetime
-from decimal import Decimal
 from typing import Tuple
 
-from parsers.common import Parser
+from parsers.common import Parser, month_abbreviations, parse_amount, parse_date
 from parsers.expense import Expense
 from parsers.nsf import NSF
 
-import calendar
 import re
 
-month_names = '|'.join(calendar.month_abbr[m] for m in range(1, 13))
-date_regex_pattern = r'(^\d+ (%s))' % month_names
-date_regex = re.compile(date_regex_pattern)
+month_names = '|'.join(month_abbreviations)
 
 # dollar_regex_pattern = r'-?(\d{1,3}(,\d{3})+|\d+)(\.(\d{2}))'
-dollar_regex_pattern = r'((\d{1,3},?)+(\.\d{2}))'
+# The withdrawal comes before the running balance, so the first amount on the line is the one we want
+dollar_regex_pattern = r'((?:\d{1,3},?)+\.\d{2})'
 dollar_regex = re.compile(dollar_regex_pattern)
 
 visa_debit_regex_pattern = r'Visa Debit (purchase|correction|refund) - (\d+)'
 visa_debit_regex = re.compile(visa_debit_regex_pattern)
 
-nsf_regex_pattern = r'Item returned NSF ((\d{1,3},?)+(\.\d{2}))'
-nsf_regex = re.compile(nsf_regex_pattern)
+nsf_prefix = 'Item returned NSF '
+
+# Date and NSF lines can only be told apart by how they start, so classify both with a single match,
+# date lines finish on the "month" group and NSF lines on the "nsf" group
+line_regex_pattern = r'(?P<day>\d+) (?P<month>%s)|%s(?P<nsf>(?:\d{1,3},?)+\.\d{2})' % (month_names, nsf_prefix)
+line_regex = re.compile(line_regex_pattern)
 
 unreported_pages = [
     'Ignore',
@@ -49,44 +49,62 @@ class MyMainMoney(Parser):
             previous_line: The previous line
 
         """
+        # Most lines are plain narration, only run the regex on lines that start like a date or an NSF
+        line_type = None
+        if line[:1].isdigit() or line.startswith(nsf_prefix):
+            line_match = line_regex.match(line)
+            if line_match is not None:
+                line_type = line_match.lastgroup
+
         # Check if the date is specified and handle that
-        date_match = date_regex.match(line)
-        if date_match is not None:
-            new_date_string = date_match.groups()[0]
-            new_date = datetime.strptime(f'{new_date_string} {self.current_year}', '%d %b %Y').date()
-            self.debug(
-                f'[cornflower_blue]{line_number:3d}: changing current date from "{self.current_date}" to "{new_date}"[/cornflower_blue]'
-            )
+        if line_type == 'month':
+            new_date = parse_date(line_match.group('day'), line_match.group('month'), self.current_year)
+            if self.debug_enabled:
+                self.debug(
+                    f'[cornflower_blue]{line_number:3d}: changing current date from "{self.current_date}" to "{new_date}"[/cornflower_blue]'
+                )
 
             # Handle statements that start in Dec of the previous year
             if self.current_date is None and new_date.month == 12:
                 new_year = self.current_year - 1
-                self.debug(
-                    f'[royal_blue1]{line_number:3d}: changing current year from "{self.current_year}" to "{new_year}"[/royal_blue1]'
-                )
+                if self.debug_enabled:
+                    self.debug(
+                        f'[royal_blue1]{line_number:3d}: changing current year from "{self.current_year}" to "{new_year}"[/royal_blue1]'
+                    )
                 self.current_year = new_year
 
             # Handle statements spanning more than one year after the start
             if self.current_date is not None and self.current_date.month == 12 and new_date.month == 1:
                 new_year = self.current_year + 1
-                self.debug(
-                    f'[royal_blue1]{line_number:3d}: changing current year from "{self.current_year}" to "{new_year}"[/royal_blue1]'
-                )
+                if self.debug_enabled:
+                    self.debug(
+                        f'[royal_blue1]{line_number:3d}: changing current year from "{self.current_year}" to "{new_year}"[/royal_blue1]'
+                    )
                 self.current_year = new_year
 
             self.current_date = new_date
 
-        nsf_match = nsf_regex.match(line)
-        if nsf_match is not None:
+        if line_type == 'nsf':
             processing_result = NSF(
                 date=self.current_date
             )
-            amount = nsf_match.groups()[0]
-            processing_result.amount = Decimal(amount.replace(',', ''))
-            self.debug(f'[yellow]NSF Item {amount} returned: "{line}"[/yellow]')
+            amount = line_match.group('nsf')
+            processing_result.amount = parse_amount(amount)
+            if self.debug_enabled:
+                self.debug(f'[yellow]NSF Item {amount} returned: "{line}"[/yellow]')
 
             return processing_result
 
+        # Check if the line is one we care about
+        category_match = self.match_category(line)
+        if category_match is None:
+            return None
+
+        category_pattern, (page, category, friendly_name) = category_match
+        if self.debug_enabled and page not in unreported_pages:
+            self.debug(f'"{line}" matches category {category_pattern}')
+
+        # Only build the expense once we know the line is one we keep
         processing_result = Expense(
             date=self.current_date
         )
@@ -98,36 +116,26 @@ class MyMainMoney(Parser):
             # self.debug(f'[purple]previous line:[/purple] [white]"{previous_line}"[/white]')
             mode, purchase_id = visa_debit_match.groups()
             if mode == 'correction':
-                self.debug(f'[orange_red1]adding correction for {purchase_id}[/orange_red1]')
+                if self.debug_enabled:
+                    self.debug(f'[orange_red1]adding correction for {purchase_id}[/orange_red1]')
                 processing_result.reversal = True
             elif mode == 'refund':
-                self.debug(f'[orange_red1]adding refund for {purchase_id}[/orange_red1]')
+                if self.debug_enabled:
+                    self.debug(f'[orange_red1]adding refund for {purchase_id}[/orange_red1]')
                 processing_result.reversal = True
             else:
-                self.debug(f'[orange_red1]adding purchase {purchase_id}[/orange_red1]')
+                if self.debug_enabled:
+                    self.debug(f'[orange_red1]adding purchase {purchase_id}[/orange_red1]')
 
             processing_result.visa_debit_id = purchase_id
 
-        # Check if the line is one we care about
-        for category_pattern in self.categories:
-            if category_pattern in line:
-                page, category, friendly_name = self.categories[category_pattern]
-                if page not in unreported_pages:
-                    self.debug(f'"{line}" matches category {category_pattern}')
-
-                processing_result.page = page
-                processing_result.category = category
-                dollar_match = dollar_regex.search(line)
-                if dollar_match is None:
-                    raise ValueError(f'could not find amount in: "{line}"')
-                amount = dollar_match.groups()[0]
-                processing_result.amount = Decimal(amount.replace(',', ''))
-                line_without_interact = re.sub(r'^Interac purchase - \d+\s', '', line[0:dollar_match.span()[0] - 1])
-                line_without_date = date_regex.sub('', line_without_interact)
-                processing_result.line = line_without_date.strip()
-                processing_result.line = friendly_name
-                break
-        else:
-            return None
+        processing_result.page = page
+        processing_result.category = category
+        dollar_match = dollar_regex.search(line)
+        if dollar_match is None:
+            raise ValueError(f'could not find amount in: "{line}"')
+        amount = dollar_match.groups()[0]
+        processing_result.amount = parse_amount(amount)
+        processing_result.line = friendly_name
 
         return processing_result
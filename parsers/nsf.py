@@ -1,18 +1,22 @@
 import datetime
 from decimal import Decimal
 
+from parsers.expense import decimal_zero
+
 
 class NSF:
     """
     An Expense that was returned NSF
 
     """
+    __slots__ = ('date', 'page', 'category', 'amount', 'line_number', 'line')
+
     date: datetime.date
-    page: str = ''
-    category: str = ''
-    amount: Decimal = Decimal(0)
-    line_number: int = 0
-    line: str = ''
+    page: str
+    category: str
+    amount: Decimal
+    line_number: int
+    line: str
 
     def __init__(self, date: datetime.date):
         """
@@ -23,6 +27,11 @@ class NSF:
 
         """
         self.date = date
+        self.page = ''
+        self.category = ''
+        self.amount = decimal_zero
+        self.line_number = 0
+        self.line = ''
 
     def __str__(self):
         """
@@ -0,0 +1,42 @@
+import datetime
+
+from main import filter_visa_debit_corrections, statement_cache_key
+from parsers.expense import Expense
+
+
+def make_expense(line, visa_debit_id=None):
+    expense = Expense(date=datetime.date(2022, 1, 3))
+    expense.line = line
+    expense.visa_debit_id = visa_debit_id
+    return expense
+
+
+def test_filter_visa_debit_corrections_removes_interleaved_pairs():
+    expenses = [
+        make_expense('purchase 1', '1111'),
+        make_expense('purchase 2', '2222'),
+        make_expense('correction 1', '1111'),
+        make_expense('rent'),
+        make_expense('correction 2', '2222'),
+        make_expense('purchase 3', '3333'),
+    ]
+
+    assert [e.line for e in filter_visa_debit_corrections(expenses)] == ['rent', 'purchase 3']
+
+
+def test_filter_visa_debit_corrections_pairs_repeated_ids_in_order():
+    expenses = [make_expense(f'entry {number}', '1111') for number in range(5)]
+
+    assert [e.line for e in filter_visa_debit_corrections(expenses)] == ['entry 4']
+
+
+def test_statement_cache_key_changes_when_statement_is_renamed(tmp_path):
+    statement = tmp_path / 'VISA Avion Unlimited 2022-01-15.pdf'
+    statement.write_bytes(b'%PDF-1.7 statement')
+    key = statement_cache_key(statement)
+
+    assert statement_cache_key(statement) == key
+
+    renamed = statement.rename(tmp_path / 'VISA Avion Unlimited 2023-01-15.pdf')
+
+    assert statement_cache_key(renamed) != key
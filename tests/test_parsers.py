@@ -0,0 +1,120 @@
+import datetime
+import types
+from decimal import Decimal
+
+import pymupdf
+import pytest
+
+from parsers.common import layout_text
+from parsers.my_main_money import MyMainMoney
+from parsers.visa_avion_unlimited import VISAAvionUnlimited
+
+categories = {
+    'Enbridge': ('Housing and Utilities', 'Gas', 'Enbridge Gas'),
+    'ROGERS': ('Business', 'Phone', 'Rogers'),
+}
+
+
+def build_page_text(rows):
+    """
+    Lay the rows out as positioned columns on a PDF page and extract its text the way process_statement does
+
+    Args:
+        rows: (y, [(x, text), ...]) for each row of the page
+
+    """
+    doc = pymupdf.open()
+    page = doc.new_page()
+    for y, cells in rows:
+        for x, text in cells:
+            page.insert_text((x, y), text, fontsize=9)
+
+    return layout_text(page.get_text('words'))
+
+
+def make_parser(parser_klass, start_date=datetime.date(2022, 1, 15)):
+    return parser_klass(categories, options=types.SimpleNamespace(verbose=False), start_date=start_date)
+
+
+def test_layout_text_reads_each_row_left_to_right():
+    text = build_page_text([
+        (100, [(200, '224.19'), (40, '3 Jan'), (100, 'Enbridge'), (300, '1,000.00')]),
+        (112, [(100, 'Next row')]),
+    ])
+
+    assert text.splitlines() == ['3 Jan Enbridge 224.19 1,000.00', 'Next row']
+
+
+def test_my_main_money_page():
+    text = build_page_text([
+        (60, [(40, 'Account summary')]),
+        (100, [(40, 'Date'), (100, 'Description'), (300, 'Withdrawals ($)'), (380, 'Deposits ($)'), (460, 'Balance ($)')]),
+        (115, [(40, '3 Jan'), (100, 'Utility Bill Pmt Enbridge Gas'), (300, '224.19'), (460, '1,000.00')]),
+        (130, [(100, 'Visa Debit purchase - 5678')]),
+        (145, [(40, '5 Jan'), (100, 'ROGERS Wireless'), (300, '1,050.25')]),
+        (160, [(100, 'Coffee shop'), (300, '4.50')]),
+    ])
+
+    parser = make_parser(MyMainMoney)
+    expenses, nsfs, _ = parser.process_page(0, text, '')
+
+    assert parser.found_start_of_items
+    assert nsfs == []
+    assert [(e.date, e.page, e.line, e.amount) for e in expenses] == [
+        (datetime.date(2022, 1, 3), 'Housing and Utilities', 'Enbridge Gas', Decimal('224.19')),
+        (datetime.date(2022, 1, 5), 'Business', 'Rogers', Decimal('1050.25')),
+    ]
+    assert expenses[1].visa_debit_id == '5678'
+
+
+def test_visa_avion_unlimited_page():
+    text = build_page_text([
+        (100, [(40, 'TRANSACTION'), (100, 'POSTING'), (170, 'ACTIVITY DESCRIPTION'), (450, 'AMOUNT ($)')]),
+        (112, [(40, 'DATE'), (100, 'DATE')]),
+        (130, [(40, 'JAN 03'), (100, 'JAN 04'), (170, 'ROGERS Wireless'), (450, '$1,045.00')]),
+        (142, [(170, '12345678')]),
+        (160, [(40, 'JAN 05'), (100, 'JAN 06'), (170, 'Enbridge Gas')]),
+        (172, [(450, '$20.00')]),
+        (190, [(40, 'JAN 07'), (100, 'JAN 08'), (170, 'Bookstore'), (450, '$3.00')]),
+    ])
+
+    parser = make_parser(VISAAvionUnlimited)
+    expenses, nsfs, _ = parser.process_page(0, text, '')
+
+    assert parser.found_start_of_items
+    assert [(e.date, e.category, e.line, e.amount) for e in expenses] == [
+        (datetime.date(2022, 1, 3), 'Phone', 'Rogers', Decimal('1045.00')),
+        (datetime.date(2022, 1, 5), 'Gas', 'Enbridge Gas', Decimal('20.00')),
+    ]
+
+
+@pytest.mark.parametrize('parser_klass', [MyMainMoney, VISAAvionUnlimited])
+def test_page_without_header_is_skipped(parser_klass):
+    text = build_page_text([
+        (100, [(40, 'Important information about your account')]),
+        (115, [(40, '3 Jan'), (100, 'ROGERS Wireless'), (300, '$12.00')]),
+    ])
+
+    parser = make_parser(parser_klass)
+
+    assert parser.process_page(0, text, 'last line') == ([], [], 'last line')
+    assert not parser.found_start_of_items
+
+
+def test_glued_header_is_still_found():
+    parser = make_parser(VISAAvionUnlimited)
+    lines = ['TRANSACTION POSTINGACTIVITY DESCRIPTION AMOUNT ($)DATE DATE', 'JAN 03 JAN 04 ROGERS $5.00']
+
+    assert parser.find_start_of_items(lines) == [parser.start_of_items, 'JAN 03 JAN 04 ROGERS $5.00']
+
+
+def test_match_category_prefers_longest_overlapping_pattern():
+    parser = VISAAvionUnlimited(
+        {'AB': ('Short', 'Short', 'Short'), 'BCDE': ('Long', 'Long', 'Long')},
+        options=types.SimpleNamespace(verbose=False),
+        start_date=datetime.date(2022, 1, 15)
+    )
+
+    assert parser.match_category('xx ABCDE 12.00') == ('BCDE', ('Long', 'Long', 'Long'))
+    assert parser.match_category('xx AB 12.00 BCDE') == ('BCDE', ('Long', 'Long', 'Long'))
+    assert parser.match_category('xx nothing 12.00') is None